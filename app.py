@@ -1,24 +1,61 @@
 import os
+import io
 import zipfile
 import shutil
 import tempfile
 import re
-import json
+import copy
+import struct
+import gzip
+import atexit
+import orjson
 import requests
 import uuid
-import xml.dom.minidom as minidom
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from lxml import etree
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from flask import Flask, render_template, request, jsonify, send_file, session, redirect, url_for
+from flask.json.provider import DefaultJSONProvider
 from werkzeug.utils import secure_filename
-from pathlib import Path
+from jinja2.utils import htmlsafe_json_dumps
 from datetime import datetime
+from email.utils import parsedate_to_datetime
+from html import escape
+from html.parser import HTMLParser
 from urllib.parse import urlparse, unquote
 
+class OrjsonProvider(DefaultJSONProvider):
+    """Routes jsonify / request.json / |tojson through orjson; /get_notes payloads get large"""
+
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_SORT_KEYS if kwargs.get('sort_keys') else 0
+        return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, default=self.default), mimetype=self.mimetype)
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.config['SECRET_KEY'] = 'production-key-v19-style-preservation'
 
 # ==================== GLOBAL STORAGE ====================
 # Storage for temporary file paths, keyed by user session ID
 USER_DATA_STORE = {}
+# Guards adding/removing records; each record carries its own 'lock' for work on its files
+USER_DATA_LOCK = threading.Lock()
+# Records idle longer than this, or beyond the cap (least recently used first), are dropped with their temp dirs
+USER_DATA_TTL = 4 * 3600
+MAX_USER_RECORDS = 256
+# Dropped records' temp dirs are deleted here, off the request thread
+CLEANUP_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix='cleanup')
 
 # ==================== CONFIGURATION ====================
 
@@ -41,6 +78,49 @@ PUBLISHER_PLACE_MAP = {
     'W. W. Norton': 'New York',
     'Knopf': 'New York'
 }
+# Keyed by lower-cased name so the editor matches publishers however Google Books capitalizes them;
+# serialized (and HTML-escaped, as |tojson would) once instead of on every page render
+PUBLISHER_MAP_JSON = htmlsafe_json_dumps({name.lower(): place for name, place in PUBLISHER_PLACE_MAP.items()},
+                                         sort_keys=True, separators=(',', ':'))
+
+# OOXML namespaces (lxml addresses tags in Clark notation: '{uri}local')
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+R_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PKG_RELS_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+XML_NS = 'http://www.w3.org/XML/1998/namespace'
+W = '{%s}' % W_NS
+R = '{%s}' % R_NS
+PKG_RELS = '{%s}' % PKG_RELS_NS
+XML_SPACE = '{%s}space' % XML_NS
+NSMAP = {'w': W_NS, 'r': R_NS}
+
+# Package parts this app rewrites; every other part is copied from the uploaded .docx
+ENDNOTES_PART = 'word/endnotes.xml'
+ENDNOTES_RELS_PART = 'word/_rels/endnotes.xml.rels'
+# Only the rewritten parts are deflated on download; level 1 is ~3x faster than the default for ~10% more bytes
+EDITED_PART_COMPRESSLEVEL = 1
+
+# Every .docx is a ZIP; anything else is turned away before a temp dir is made
+ZIP_MAGIC = b'PK\x03\x04'
+# Largest total uncompressed size accepted for an upload (zip-bomb guard)
+MAX_DOCX_UNCOMPRESSED = 200 * 1024 * 1024
+
+# Uploaded documents are untrusted: never expand entities or touch the network
+XML_PARSER = etree.XMLParser(resolve_entities=False, no_network=True)
+
+# Prebuilt runs for rewritten notes; each new run is one deepcopy instead of a chain of SubElement calls
+def build_run_template(*props):
+    run = etree.Element(W + 'r', nsmap=NSMAP)
+    rPr = etree.SubElement(run, W + 'rPr')
+    for tag, attrs in props: etree.SubElement(rPr, W + tag, {W + k: v for k, v in attrs.items()})
+    etree.SubElement(run, W + 't')
+    return run
+
+TIMES_NEW_ROMAN = ('rFonts', {'ascii': 'Times New Roman', 'hAnsi': 'Times New Roman'})
+TEXT_RUN_TEMPLATE = build_run_template(TIMES_NEW_ROMAN)
+ITALIC_RUN_TEMPLATE = build_run_template(TIMES_NEW_ROMAN, ('i', {}))
+HYPERLINK_TEMPLATE = etree.Element(W + 'hyperlink', nsmap=NSMAP)
+HYPERLINK_TEMPLATE.append(build_run_template(('rStyle', {'val': 'Hyperlink'}), ('color', {'val': '0000FF'}), ('u', {'val': 'single'})))
 
 # Maps .gov domains to proper Agency Author Names
 GOV_AGENCY_MAP = {
@@ -57,84 +137,214 @@ GOV_AGENCY_MAP = {
     'usda.gov': 'U.S. Department of Agriculture',
 }
 
+# Regex patterns, compiled once at import instead of on every call
+DIGITS_RE = re.compile(r'\d+')
+LEADING_NUMBER_RE = re.compile(r'^\s*\d+\.?\s*')
+PAGE_NUMBERS_RE = re.compile(r',?\s*pp?\.?\s*\d+(-\d+)?\.?$')
+TRAILING_NUMBER_RE = re.compile(r',?\s*\d+\.?$')
+URL_QUERY_RE = re.compile(r'^(http|www\.)', re.IGNORECASE)
+
+# Heuristic titles: file extensions dropped from a URL slug, and its word separators
+PAGE_EXTENSIONS = ('.pdf', '.htm', '.html', '.aspx', '.asp', '.php')
+SLUG_SEPARATORS = str.maketrans('_-', '  ')
+
+# ==================== HTTP CLIENT ====================
+# One pooled session for every outbound lookup, so repeat calls to the same host
+# (Google Books in particular) reuse keep-alive connections instead of re-handshaking
+HTTP_SESSION = requests.Session()
+HTTP_SESSION.headers['User-Agent'] = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+# Gateway errors are usually momentary, so they get the same quick retries as dropped connections.
+# Retry-After is ignored (a 503 can ask for hours, which would pin a LOOKUP_POOL worker), and 429 is
+# left out since retrying it without waiting is pointless. Reads are never retried, so the read limit
+# of PAGE_TIMEOUT / BOOKS_TIMEOUT bounds a whole lookup against a silent host
+_http_retry = Retry(total=2, connect=2, read=0, backoff_factor=0.1, status_forcelist=(502, 503, 504),
+                    raise_on_status=False, respect_retry_after_header=False)
+_http_adapter = HTTPAdapter(pool_connections=8, pool_maxsize=32, max_retries=_http_retry)
+HTTP_SESSION.mount('https://', _http_adapter)
+HTTP_SESSION.mount('http://', _http_adapter)
+
+# (connect, read) seconds for Google Books; a stalled socket shouldn't hang a search forever
+BOOKS_TIMEOUT = (2, 5)
+# (connect, read) seconds for cited web pages; unreachable hosts give up quickly, slow servers keep the old 7s
+PAGE_TIMEOUT = (3, 7)
+
+# Shorter queries (ignoring spaces and hyphens) aren't worth a Google Books round-trip
+MIN_QUERY_LENGTH = 4
+
+# Most characters of a page read while looking for its <title>
+TITLE_SCAN_LIMIT = 64 * 1024
+
+# Titles served by bot walls and error pages rather than the cited page
+BLOCKED_TITLE_WORDS = ("Just a moment", "Access Denied", "Error", "404")
+
+# Responses worth gzipping, and the smallest body for which it pays off
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/html', 'text/css', 'application/javascript', 'text/javascript')
+MIN_COMPRESS_SIZE = 1024
+
+# Upper bound on outbound lookups running in parallel, across all /search_batch requests
+MAX_LOOKUP_WORKERS = 8
+# Shared by every request, so concurrent batches can't multiply the outbound connections
+LOOKUP_POOL = ThreadPoolExecutor(max_workers=MAX_LOOKUP_WORKERS, thread_name_prefix='lookup')
+# Most queries one /search_batch may carry, and most of its lookups queued or running at once,
+# so a single large batch can't hold every LOOKUP_POOL worker while other users wait
+MAX_BATCH_QUERIES = 50
+MAX_LOOKUPS_PER_REQUEST = 4
+
+# ==================== LOOKUP CACHE ====================
+class TTLCache:
+    """Small thread-safe LRU cache whose entries expire after a fixed number of seconds"""
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None: return None
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+# Page title / Last-Modified per URL; citing the same source twice shouldn't refetch it
+PAGE_INFO_CACHE = TTLCache(maxsize=4096, ttl=6 * 3600)
+# ETag / Last-Modified per URL, kept well past PAGE_INFO_CACHE so expired entries can be revalidated cheaply
+PAGE_VALIDATOR_CACHE = TTLCache(maxsize=4096, ttl=7 * 24 * 3600)
+# Google Books results per normalized query; retries and shared author/title searches hit RAM
+BOOKS_CACHE = TTLCache(maxsize=2048, ttl=24 * 3600)
+# Gzipped static assets by ETag, so each version of editor.js/editor.css is compressed once
+STATIC_GZIP_CACHE = TTLCache(maxsize=64, ttl=24 * 3600)
+
 # ==================== RELATIONSHIP MANAGER ====================
 class RelationshipManager:
-    """Handles adding URLs to word/_rels/endnotes.xml.rels"""
+    """Tracks the relationships of word/_rels/endnotes.xml.rels, adding URLs as hyperlinks"""
     
-    def __init__(self, extract_dir):
-        self.rels_dir = os.path.join(extract_dir, 'word', '_rels')
-        self.rels_path = os.path.join(self.rels_dir, 'endnotes.xml.rels')
+    def __init__(self, rels_xml=None):
         self.relationships = []
+        self.hyperlinks_by_url = {}  # Target URL -> hyperlink Relationship, for O(1) reuse
         self.next_id = 1
-        self._load()
-
-    def _load(self):
-        if not os.path.exists(self.rels_dir):
-            os.makedirs(self.rels_dir)
-        if os.path.exists(self.rels_path):
-            with open(self.rels_path, 'r', encoding='utf-8') as f:
-                dom = minidom.parseString(f.read())
-                for rel in dom.getElementsByTagName('Relationship'):
-                    rid = rel.getAttribute('Id')
-                    match = re.search(r'\d+', rid)
-                    if match:
-                        num_id = int(match.group())
-                        self.next_id = max(self.next_id, num_id + 1)
-                    self.relationships.append({
-                        'Id': rid,
-                        'Type': rel.getAttribute('Type'),
-                        'Target': rel.getAttribute('Target'),
-                        'TargetMode': rel.getAttribute('TargetMode')
-                    })
+        self.dirty = False  # True once the relationships differ from the uploaded part
+        if rels_xml: self._load(rels_xml)
+
+    def _load(self, rels_xml):
+        root = etree.fromstring(rels_xml, XML_PARSER)
+        for rel in root.iter(PKG_RELS + 'Relationship'):
+            rid = rel.get('Id', '')
+            match = DIGITS_RE.search(rid)
+            if match:
+                num_id = int(match.group())
+                self.next_id = max(self.next_id, num_id + 1)
+            entry = {
+                'Id': rid,
+                'Type': rel.get('Type', ''),
+                'Target': rel.get('Target', ''),
+                'TargetMode': rel.get('TargetMode', '')
+            }
+            self.relationships.append(entry)
+            if entry['Type'].endswith('/hyperlink'):
+                self.hyperlinks_by_url.setdefault(entry['Target'], entry)
 
     def get_or_create_hyperlink(self, url):
         """Returns the rId for a URL, creating a new Relationship if needed"""
-        for rel in self.relationships:
-            if rel['Target'] == url and rel['Type'].endswith('/hyperlink'):
-                return rel['Id']
+        rel = self.hyperlinks_by_url.get(url)
+        if rel:
+            return rel['Id']
         new_id = f"rId{self.next_id}"
         self.next_id += 1
-        self.relationships.append({
+        rel = {
             'Id': new_id,
             'Type': "http://schemas.openxmlformats.org/officeDocument/2006/relationships/hyperlink",
             'Target': url,
             'TargetMode': "External"
-        })
-        self._save()
+        }
+        self.relationships.append(rel)
+        self.hyperlinks_by_url[url] = rel
+        self.dirty = True
         return new_id
 
-    def _save(self):
-        """Save relationships file with proper XML formatting"""
-        impl = minidom.getDOMImplementation()
-        doc = impl.createDocument(None, None, None)
-        
+    def hyperlink_targets(self):
+        """Maps rId -> URL for the hyperlink relationships"""
+        return {rel['Id']: rel['Target'] for rel in self.relationships if rel['Type'].endswith('/hyperlink')}
+
+    def to_xml(self):
+        """Serializes the relationships part with proper XML formatting"""
         # Create root element with namespace
-        rels_elem = doc.createElement('Relationships')
-        rels_elem.setAttribute('xmlns', "http://schemas.openxmlformats.org/package/2006/relationships")
-        doc.appendChild(rels_elem)
-        
+        rels_elem = etree.Element(PKG_RELS + 'Relationships', nsmap={None: PKG_RELS_NS})
+
         # Add all relationships
         for rel in self.relationships:
-            node = doc.createElement('Relationship')
-            node.setAttribute('Id', rel['Id'])
-            node.setAttribute('Type', rel['Type'])
-            node.setAttribute('Target', rel['Target'])
+            node = etree.SubElement(rels_elem, PKG_RELS + 'Relationship',
+                                    Id=rel['Id'], Type=rel['Type'], Target=rel['Target'])
             if rel.get('TargetMode'):
-                node.setAttribute('TargetMode', rel['TargetMode'])
-            rels_elem.appendChild(node)
-        
-        # Write with proper XML declaration
-        with open(self.rels_path, 'w', encoding='utf-8') as f:
-            # Write XML declaration manually to match Word's format
-            f.write('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\r\n')
-            # Write the rest without the XML declaration
-            f.write(rels_elem.toxml())
+                node.set('TargetMode', rel['TargetMode'])
+
+        # XML declaration written manually to match Word's format
+        return b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\r\n' + etree.tostring(rels_elem, encoding='UTF-8')
 
 # ==================== BACKEND LOGIC ====================
 
 def get_user_data():
     if 'user_id' not in session: return None
-    return USER_DATA_STORE.get(session['user_id'])
+    user_data = USER_DATA_STORE.get(session['user_id'])
+    if user_data: user_data['last_used'] = time.monotonic()
+    return user_data
+
+def discard_user_data(user_data):
+    """Deletes a dropped record's temp dir in the background, once any in-flight work on it has finished"""
+    def remove():
+        with user_data['lock']: shutil.rmtree(user_data['temp_dir'], ignore_errors=True)
+    CLEANUP_POOL.submit(remove)
+
+def evict_user_data():
+    """Drops expired records (and the oldest ones over MAX_USER_RECORDS), deleting their temp dirs"""
+    now = time.monotonic()
+    with USER_DATA_LOCK:
+        by_age = sorted(USER_DATA_STORE.items(), key=lambda item: item[1]['last_used'])
+        overflow = max(len(by_age) - MAX_USER_RECORDS, 0)
+        evicted = [USER_DATA_STORE.pop(user_id) for i, (user_id, user_data) in enumerate(by_age)
+                   if i < overflow or now - user_data['last_used'] > USER_DATA_TTL]
+    for user_data in evicted: discard_user_data(user_data)
+
+@atexit.register
+def cleanup_user_data():
+    """Deletes every remaining upload's temp dir when the process exits"""
+    with USER_DATA_LOCK:
+        remaining = list(USER_DATA_STORE.values())
+        USER_DATA_STORE.clear()
+    for user_data in remaining: shutil.rmtree(user_data['temp_dir'], ignore_errors=True)
+
+def is_acceptable_docx(path):
+    """True if `path` is a readable ZIP whose members inflate to no more than MAX_DOCX_UNCOMPRESSED bytes"""
+    try:
+        with zipfile.ZipFile(path) as z:
+            return sum(info.file_size for info in z.infolist()) <= MAX_DOCX_UNCOMPRESSED
+    except: return False
+
+def get_endnotes_tree(user_data):
+    """Returns the session's parsed endnotes.xml (None if the document has no endnotes), reading it from the .docx on first use only"""
+    if user_data.get('endnotes_tree') is None:
+        with zipfile.ZipFile(user_data['source_file']) as z:
+            members = set(z.namelist())
+            if ENDNOTES_PART not in members: return None
+            tree = etree.fromstring(z.read(ENDNOTES_PART), XML_PARSER).getroottree()
+            rels_xml = z.read(ENDNOTES_RELS_PART) if ENDNOTES_RELS_PART in members else None
+        # w:id -> <w:endnote>; edits only rewrite a note's children, so the index never goes stale
+        user_data['endnote_by_id'] = {en.get(W + 'id'): en for en in tree.getroot().iterchildren(W + 'endnote')}
+        # Real notes in id order (separators -1/0 excluded); the set of ids never changes after upload
+        user_data['note_ids'] = sorted((en_id for en_id in user_data['endnote_by_id'] if en_id and en_id not in ['-1', '0']), key=int)
+        user_data['rel_mgr'] = RelationshipManager(rels_xml)
+        user_data['endnotes_tree'] = tree
+    return user_data['endnotes_tree']
 
 def clean_search_term(text):
     """Clean search terms for book searches - but NOT for URLs"""
@@ -143,51 +353,116 @@ def clean_search_term(text):
         return text
     
     # For non-URLs, clean up book citation formatting
-    text = re.sub(r'^\s*\d+\.?\s*', '', text)  # Remove leading numbers
-    text = re.sub(r',?\s*pp?\.?\s*\d+(-\d+)?\.?$', '', text)  # Remove page numbers
-    text = re.sub(r',?\s*\d+\.?$', '', text)  # Remove trailing numbers
+    match = LEADING_NUMBER_RE.match(text)  # Remove leading numbers
+    if match: text = text[match.end():]
+    # The tail patterns are anchored at $ but re still tries them from every offset,
+    # so only run them when the text actually ends in a number
+    if ends_in_number(text):
+        text = PAGE_NUMBERS_RE.sub('', text)  # Remove page numbers
+        if ends_in_number(text): text = TRAILING_NUMBER_RE.sub('', text)  # Remove trailing numbers
     return text.strip()
 
+def ends_in_number(text):
+    """Cheap pre-check for PAGE_NUMBERS_RE / TRAILING_NUMBER_RE: a digit, optionally followed by one '.'"""
+    return (text[:-1] if text.endswith('.') else text)[-1:].isdigit()
+
 def get_agency_name(domain):
     """Returns the official agency name based on the domain."""
-    # Handle subdomains by checking the main domain
-    parts = domain.split('.')
-    
-    # Try the full domain first (for special cases)
-    if domain in GOV_AGENCY_MAP:
-        return GOV_AGENCY_MAP[domain]
-    
-    # Then try the root domain (last two parts)
-    if len(parts) >= 2:
-        root_domain = f"{parts[-2]}.{parts[-1]}"
-        if root_domain in GOV_AGENCY_MAP:
-            return GOV_AGENCY_MAP[root_domain]
-    
-    # Special handling for subdomains of known agencies
-    if 'doe.gov' in domain:
-        return 'U.S. Department of Energy'
-    elif 'energy.gov' in domain:
-        return 'U.S. Department of Energy'
-    
-    return "U.S. Government"
+    # Try the full domain first (for special cases), then the root domain (last two labels)
+    # so subdomains such as fossil.energy.gov resolve to their agency
+    agency = GOV_AGENCY_MAP.get(domain) or GOV_AGENCY_MAP.get('.'.join(domain.rsplit('.', 2)[-2:]))
+    return agency or "U.S. Government"
 
-def get_heuristic_title(url):
-    """Generates a title from the URL slug if scraping fails."""
-    parsed_uri = urlparse(url)
-    path = parsed_uri.path
-    slug = [s for s in path.split('/') if s][-1] if path.split('/') else ''
+def get_heuristic_title(parsed_uri):
+    """Generates a title from the (already parsed) URL's slug if scraping fails."""
+    # Last non-empty path segment ('' for a bare domain)
+    path = parsed_uri.path.rstrip('/')
+    slug = path[path.rfind('/') + 1:]
     
-    clean_filename = unquote(slug).replace('_', ' ').replace('-', ' ').title()
+    slug = unquote(slug)
+    stem, ext = os.path.splitext(slug)
+    if ext.lower() in PAGE_EXTENSIONS: slug = stem
+    clean_filename = slug.translate(SLUG_SEPARATORS).title().strip()
     
-    if clean_filename.lower().endswith(('.pdf', '.htm', '.html', '.aspx', '.asp', '.php')):
-        clean_filename = clean_filename[:-4].strip()
-        
     if not clean_filename or len(clean_filename) < 5:
         domain = parsed_uri.netloc.replace('www.', '')
-        return domain.split('.')[0].title() 
+        return domain.partition('.')[0].title() 
         
     return clean_filename
 
+class TitleParser(HTMLParser):
+    """Collects the text of the first <title> element; `done` flips once it closes"""
+
+    def __init__(self):
+        super().__init__()
+        self.in_title = False
+        self.done = False
+        self.parts = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'title' and not self.done: self.in_title = True
+
+    def handle_endtag(self, tag):
+        if tag == 'title' and self.in_title:
+            self.in_title = False
+            self.done = True
+
+    def handle_data(self, data):
+        if self.in_title: self.parts.append(data)
+
+def scrape_title(response):
+    """Feeds a streamed response into a TitleParser, stopping as soon as </title> is read"""
+    if response.encoding is None: response.encoding = 'utf-8'
+    parser = TitleParser()
+    scanned = 0
+    for chunk in response.iter_content(chunk_size=4096, decode_unicode=True):
+        # PDFs served without a Content-Type have no <title> worth scanning for
+        if not scanned and chunk.startswith('%PDF'): return ''
+        parser.feed(chunk)
+        scanned += len(chunk)
+        # <title> lives in <head>; past TITLE_SCAN_LIMIT the page doesn't have a usable one
+        if parser.done or scanned >= TITLE_SCAN_LIMIT: break
+    # Titles are often wrapped and indented in the markup; collapse to single spaces
+    return " ".join("".join(parser.parts).split())
+
+def fetch_page_info(url):
+    """Returns (title, last_updated) scraped from the live page, or None if it couldn't be reached"""
+    headers = {'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+               # Servers that honour Range send no more than the title scan could ever read
+               'Range': 'bytes=0-%d' % (TITLE_SCAN_LIMIT - 1)}
+    # Validators from an earlier fetch let the server answer 304 instead of resending the page
+    validators = PAGE_VALIDATOR_CACHE.get(url)
+    if validators:
+        etag, modified, cached_info = validators
+        if etag: headers['If-None-Match'] = etag
+        if modified: headers['If-Modified-Since'] = modified
+    page_title = last_updated = None
+    try:
+        # Stream the body: the title sits in <head>, so the rest of the page is never downloaded
+        with HTTP_SESSION.get(url, headers=headers, timeout=PAGE_TIMEOUT, allow_redirects=True, stream=True) as response:
+            if response.status_code == 304 and validators: return cached_info
+            # Non-200 answers are often transient, so they are not worth caching
+            if response.status_code not in (200, 206): return None
+            # Scrape <title>; PDFs, images and other non-HTML bodies are never read
+            content_type = response.headers.get('Content-Type', '')
+            raw_title = scrape_title(response) if not content_type or 'html' in content_type.lower() else ''
+            if raw_title:
+                if not any(block_word in raw_title for block_word in BLOCKED_TITLE_WORDS):
+                     page_title = raw_title.partition(' | ')[0].strip()
+                     
+            # Scrape Last Modified/Published Date from headers 
+            if 'Last-Modified' in response.headers:
+                try:
+                    last_updated = parsedate_to_datetime(response.headers['Last-Modified']).strftime("%B %d, %Y")
+                except:
+                     pass
+            page_info = (page_title, last_updated)
+            etag, modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+            if etag or modified: PAGE_VALIDATOR_CACHE.set(url, (etag, modified, page_info))
+    except:
+        return None # Use heuristic title and generic date if request fails
+    return page_info
+
 def fetch_web_metadata(url):
     if not url.startswith('http'): url = 'http://' + url
     
@@ -200,37 +475,15 @@ def fetch_web_metadata(url):
         # Determine Agency Author Name (Guaranteed for .gov)
         author_name = get_agency_name(domain) if is_gov else ""
         
-        last_updated = None
-        
-        # 1. Start with Heuristic Title as the safest option
-        page_title = get_heuristic_title(url)
-        
-        # 2. Try to fetch real title from the server
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8'
-        }
+        # 1. Try to fetch real title from the server (served from cache for repeat URLs)
+        page_info = PAGE_INFO_CACHE.get(url)
+        if page_info is None:
+            page_info = fetch_page_info(url)
+            if page_info is not None: PAGE_INFO_CACHE.set(url, page_info)
+        page_title, last_updated = page_info or (None, None)
         
-        try:
-            s = requests.Session()
-            response = s.get(url, headers=headers, timeout=7, allow_redirects=True)
-            
-            if response.status_code == 200:
-                # Scrape <title>
-                title_match = re.search(r'<title>(.*?)</title>', response.text, re.IGNORECASE | re.DOTALL)
-                if title_match:
-                    raw_title = title_match.group(1).strip()
-                    if not any(block_word in raw_title for block_word in ["Just a moment", "Access Denied", "Error", "404"]):
-                         page_title = re.sub(r' \| .*$', '', raw_title).strip()
-                         
-                # Scrape Last Modified/Published Date from headers 
-                if 'Last-Modified' in response.headers:
-                    try:
-                        last_updated = datetime.strptime(response.headers['Last-Modified'][:25], '%a, %d %b %Y %H:%M:%S').strftime("%B %d, %Y")
-                    except:
-                         pass
-        except:
-            pass # Use heuristic title and generic date if request fails
+        # 2. Fall back to the Heuristic Title, reusing the URL parsed above
+        if not page_title: page_title = get_heuristic_title(parsed_uri)
 
         # Final cleanup for output
         access_date = datetime.now().strftime("%B %d, %Y")
@@ -259,13 +512,23 @@ def fetch_web_metadata(url):
             'id': 'web_result_failed'
         }]
 
+def is_searchable(query):
+    """Rejects queries that can't identify a book (too short, or only punctuation) before any network call"""
+    compact = query.replace('-', '').replace(' ', '')
+    if len(compact) < MIN_QUERY_LENGTH: return False
+    # Digits alone still count: ISBNs, and numeric titles such as "1984" or "2666"
+    return any(ch.isalnum() for ch in compact)
+
 def query_google_books(query):
-    url_pattern = re.compile(r'^(http|www\.)', re.IGNORECASE)
-    if url_pattern.match(query): return fetch_web_metadata(query)
+    if URL_QUERY_RE.match(query): return fetch_web_metadata(query)
+    cache_key = " ".join(query.split()).lower()
+    if not is_searchable(cache_key): return []
+    cached = BOOKS_CACHE.get(cache_key)
+    if cached is not None: return cached
     api_url = "https://www.googleapis.com/books/v1/volumes"
     params = {'q': query, 'maxResults': 4, 'printType': 'books'}
     try:
-        r = requests.get(api_url, params=params)
+        r = HTTP_SESSION.get(api_url, params=params, timeout=BOOKS_TIMEOUT)
         data = r.json()
         results = []
         if 'items' in data:
@@ -280,304 +543,448 @@ def query_google_books(query):
                     'year': info.get('publishedDate', '')[:4],
                     'id': item['id']
                 })
+        # Error answers (quota, 5xx) are not cached
+        if r.status_code == 200: BOOKS_CACHE.set(cache_key, results)
         return results
     except: return []
 
-def extract_endnotes_xml(user_data):
+def read_run(run):
+    """Reads a <w:r> in one pass over its subtree: returns (text, is_italic, is_endnote_ref)"""
+    texts = []
+    is_italic = is_ref = False
+    for el in run.iter(W + 't', W + 'i', W + 'endnoteRef'):
+        if el.tag == W + 't':
+            if el.text: texts.append(el.text)
+        elif el.tag == W + 'endnoteRef':
+            is_ref = True
+        elif el.get(W + 'val') not in ('0', 'false', 'off'):
+            is_italic = True
+    return "".join(texts), is_italic, is_ref
+
+def extract_endnotes_xml(user_data, offset=0, limit=None):
     """
     Reads the endnotes.xml and converts complex Word markup (italics, hyperlinks) 
     into simple HTML for the editor, preserving original link targets.
+    Returns (notes, total); only the notes in [offset, offset + limit) are converted.
     """
-    if not user_data or not user_data['endnotes_file']: return []
-    with open(user_data['endnotes_file'], 'r', encoding='utf-8') as f:
-        dom = minidom.parseString(f.read())
+    if not user_data: return [], 0
+    if get_endnotes_tree(user_data) is None: return [], 0
     
-    notes = []
+    # Note order comes from the id index, so a page only converts its own notes
+    note_ids = user_data['note_ids']
+    page_ids = note_ids[offset:] if limit is None else note_ids[offset:offset + limit]
     
-    # Find the relationships file path (needed to resolve existing hyperlinks)
-    rels_path = os.path.join(user_data['extract_dir'], 'word', '_rels', 'endnotes.xml.rels')
-    relationships = {}
-    if os.path.exists(rels_path):
-        rels_dom = minidom.parse(rels_path)
-        for rel in rels_dom.getElementsByTagName('Relationship'):
-            if rel.getAttribute('Type').endswith('/hyperlink'):
-                relationships[rel.getAttribute('Id')] = rel.getAttribute('Target')
-
-    for en in dom.getElementsByTagName('w:endnote'):
-        en_id = en.getAttribute('w:id')
-        if en_id and en_id not in ['-1', '0']:
-            html_parts = []
-            full_text_parts = []
+    # Converted notes are kept until that note is edited, so repeat fetches skip the conversion
+    note_html = user_data['note_html']
+    missing = [en_id for en_id in page_ids if en_id not in note_html]
+    if missing:
+        # Hyperlink targets by rId (needed to resolve existing hyperlinks)
+        relationships = user_data['rel_mgr'].hyperlink_targets()
+        for en_id in missing: note_html[en_id] = endnote_to_html(en_id, user_data['endnote_by_id'][en_id], relationships)
+    
+    notes = [note_html[en_id] for en_id in page_ids]
+    return notes, len(note_ids)
+
+def endnote_to_html(en_id, en, relationships):
+    """Converts one <w:endnote> into the {'id', 'html', 'clean_term'} dict the editor uses"""
+    html_parts = []
+    full_text_parts = []
+    
+    p = en.find('.//w:p', NSMAP)
+    
+    # --- Iterate through direct children of the paragraph ---
+    for node in p:
             
-            p = en.getElementsByTagName('w:p')[0]
+        # Case 1: Existing Hyperlink (<w:hyperlink>)
+        if node.tag == W + 'hyperlink':
+            r_id = node.get(R + 'id')
+            url = relationships.get(r_id, '#') # Get original URL target
             
-            # --- Iterate through direct children of the paragraph ---
-            for node in p.childNodes:
+            # Extract the text content from the runs inside the hyperlink
+            link_text = "".join(t.text for t in node.iter(W + 't') if t.text)
+            full_text_parts.append(link_text)
                 
-                if node.nodeType == node.ELEMENT_NODE:
-                    
-                    # Case 1: Existing Hyperlink (<w:hyperlink>)
-                    if node.tagName == 'w:hyperlink':
-                        r_id = node.getAttribute('r:id')
-                        url = relationships.get(r_id, '#') # Get original URL target
-                        
-                        # Extract the text content from the runs inside the hyperlink
-                        link_text = ""
-                        for run in node.getElementsByTagName('w:r'):
-                            text = "".join([t.firstChild.nodeValue for t in run.getElementsByTagName('w:t') if t.firstChild])
-                            link_text += text
-                            full_text_parts.append(text)
-                            
-                        # Convert to HTML anchor tag
-                        html_parts.append(f'<a href="{url}">{link_text}</a>')
-                        continue
-
-                    # Case 2: Standard Run (<w:r>) (for plain text, spaces, or italics)
-                    if node.tagName == 'w:r':
-                        # Check for Endnote Marker and skip it
-                        if node.getElementsByTagName('w:endnoteRef'): continue
-                        
-                        text = "".join([t.firstChild.nodeValue for t in node.getElementsByTagName('w:t') if t.firstChild])
-                        if not text: continue
-                        full_text_parts.append(text)
-                        
-                        # Check Italics
-                        rPr = node.getElementsByTagName('w:rPr')
-                        is_italic = False
-                        if rPr and rPr[0].getElementsByTagName('w:i'): is_italic = True
-                        
-                        if is_italic: html_parts.append(f"<em>{text}</em>")
-                        else: html_parts.append(text)
-            
-            final_html = "".join(html_parts).strip()
-            clean_term = clean_search_term("".join(full_text_parts).strip())
-            notes.append({'id': en_id, 'html': final_html, 'clean_term': clean_term})
+            # Convert to HTML anchor tag
+            html_parts.append(f'<a href="{escape(url)}">{escape(link_text, quote=False)}</a>')
+            continue
+
+        # Case 2: Standard Run (<w:r>) (for plain text, spaces, or italics)
+        if node.tag == W + 'r':
+            text, is_italic, is_ref = read_run(node)
+            # Skip the Endnote Marker and empty runs
+            if is_ref or not text: continue
+            full_text_parts.append(text)
             
-    return sorted(notes, key=lambda x: int(x['id']))
+            if is_italic: html_parts.append(f"<em>{escape(text, quote=False)}</em>")
+            else: html_parts.append(escape(text, quote=False))
+    
+    final_html = "".join(html_parts).strip()
+    clean_term = clean_search_term("".join(full_text_parts).strip())
+    return {'id': en_id, 'html': final_html, 'clean_term': clean_term}
+
+class NoteHTMLParser(HTMLParser):
+    """Turns the editor's HTML (text, <em>/<i>, <a href>) into runs appended straight onto a <w:p>"""
+
+    def __init__(self, p, rel_mgr):
+        super().__init__()
+        self.p = p
+        self.rel_mgr = rel_mgr
+        self.italic = 0
+        self.link_url = None
+        self.link_parts = []
+        self.text_parts = []
+
+    def flush_text(self):
+        """Emits pending plain text as one run (the parser may hand it over in several pieces)"""
+        if self.text_parts:
+            self.add_text("".join(self.text_parts))
+            self.text_parts = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('em', 'i'):
+            self.flush_text()
+            self.italic += 1
+        elif tag == 'a':
+            self.flush_text()
+            href = dict(attrs).get('href')
+            if href: self.link_url, self.link_parts = href, []
+
+    def handle_endtag(self, tag):
+        if tag in ('em', 'i'):
+            self.flush_text()
+            self.italic = max(self.italic - 1, 0)
+        elif tag == 'a' and self.link_url is not None:
+            self.add_hyperlink(self.link_url, "".join(self.link_parts))
+            self.link_url = None
+
+    def handle_data(self, data):
+        data = data.replace('\xa0', ' ')
+        if self.link_url is not None: self.link_parts.append(data)
+        else: self.text_parts.append(data)
+
+    def add_hyperlink(self, url, text):
+        # Hyperlink style, blue, underlined
+        hlink = copy.deepcopy(HYPERLINK_TEMPLATE)
+        hlink.set(R + 'id', self.rel_mgr.get_or_create_hyperlink(url))
+        hlink[0][-1].text = text
+        self.p.append(hlink)
+
+    def add_text(self, text):
+        # Always Times New Roman for consistency, italic inside <em>/<i>
+        run = copy.deepcopy(ITALIC_RUN_TEMPLATE if self.italic else TEXT_RUN_TEMPLATE)
+        t = run[-1]
+        # Preserve spaces
+        if text.startswith(' ') or text.endswith(' '):
+            t.set(XML_SPACE, 'preserve')
+        t.text = text
+        self.p.append(run)
+
+    def close(self):
+        super().close()
+        self.flush_text()
+        # An unclosed <a> still keeps its text
+        if self.link_url is not None:
+            self.add_hyperlink(self.link_url, "".join(self.link_parts))
+            self.link_url = None
 
 def write_updated_note(user_data, note_id, html_content):
     if not user_data: return
-    path = user_data['endnotes_file']
-    dom = minidom.parse(str(path))
-    rel_mgr = RelationshipManager(user_data['extract_dir'])
+    if get_endnotes_tree(user_data) is None: return
+    en = user_data['endnote_by_id'].get(str(note_id))
+    if en is None: return
+    rel_mgr = user_data['rel_mgr']
+    # Saves fire on every editor blur; if the note still renders to the same HTML there is nothing to rewrite
+    current = user_data['note_html'].get(str(note_id)) or endnote_to_html(str(note_id), en, rel_mgr.hyperlink_targets())
+    if current['html'] == html_content.strip(): return
+    user_data['note_html'].pop(str(note_id), None)
     
-    for en in dom.getElementsByTagName('w:endnote'):
-        if en.getAttribute('w:id') == str(note_id):
-            # Get all paragraphs in this endnote
-            paragraphs = en.getElementsByTagName('w:p')
-            
-            # Work with the first paragraph (main content)
-            if paragraphs:
-                p = paragraphs[0]
-                
-                # Find and preserve the endnote reference run
-                ref_run = None
-                for run in p.getElementsByTagName('w:r'):
-                    if run.getElementsByTagName('w:endnoteRef'):
-                        ref_run = run.cloneNode(deep=True)  # Clone to preserve all properties
-                        break
-                
-                # Clear the paragraph content but keep the paragraph element
-                while p.hasChildNodes(): 
-                    p.removeChild(p.firstChild)
-                
-                # Re-add paragraph properties with EndnoteText style
-                pPr = dom.createElement('w:pPr')
-                pStyle = dom.createElement('w:pStyle')
-                pStyle.setAttribute('w:val', 'EndnoteText')
-                pPr.appendChild(pStyle)
-                p.appendChild(pPr)
-                
-                # Re-add the endnote reference with proper style
-                if ref_run:
-                    # Ensure the reference has the proper style
-                    rPr_elements = ref_run.getElementsByTagName('w:rPr')
-                    if not rPr_elements:
-                        rPr = dom.createElement('w:rPr')
-                        rStyle = dom.createElement('w:rStyle')
-                        rStyle.setAttribute('w:val', 'EndnoteReference')
-                        rPr.appendChild(rStyle)
-                        ref_run.insertBefore(rPr, ref_run.firstChild)
-                    else:
-                        # Check if EndnoteReference style exists
-                        has_style = False
-                        for rPr in rPr_elements:
-                            if rPr.getElementsByTagName('w:rStyle'):
-                                has_style = True
-                                break
-                        if not has_style and rPr_elements:
-                            rStyle = dom.createElement('w:rStyle')
-                            rStyle.setAttribute('w:val', 'EndnoteReference')
-                            rPr_elements[0].appendChild(rStyle)
-                    
-                    p.appendChild(ref_run)
-                    
-                    # Add space after endnote reference
-                    r = dom.createElement('w:r')
-                    t = dom.createElement('w:t')
-                    t.setAttribute('xml:space', 'preserve')
-                    t.appendChild(dom.createTextNode(" "))
-                    r.appendChild(t)
-                    p.appendChild(r)
-                
-                # Parse and add the HTML content
-                tokens = re.split(r'(<a href="[^"]+">.*?</a>|<em>.*?</em>)', html_content)
-                
-                for token in tokens:
-                    if not token: continue
-                    token = token.replace('&nbsp;', ' ').replace('&amp;', '&')
-                    
-                    # Case 1: Hyperlink
-                    if token.startswith('<a href='):
-                        match = re.match(r'<a href="([^"]+)">(.*?)</a>', token)
-                        if match:
-                            url = match.group(1)
-                            text = match.group(2)
-                            
-                            r_id = rel_mgr.get_or_create_hyperlink(url)
-                            
-                            hlink = dom.createElement('w:hyperlink')
-                            hlink.setAttribute('r:id', r_id)
-                            
-                            run = dom.createElement('w:r')
-                            rPr = dom.createElement('w:rPr')
-                            
-                            # Add Hyperlink style
-                            rStyle = dom.createElement('w:rStyle')
-                            rStyle.setAttribute('w:val', 'Hyperlink')
-                            rPr.appendChild(rStyle)
-                            
-                            # Add blue color
-                            color = dom.createElement('w:color')
-                            color.setAttribute('w:val', '0000FF')
-                            rPr.appendChild(color)
-                            
-                            # Add underline
-                            u = dom.createElement('w:u')
-                            u.setAttribute('w:val', 'single')
-                            rPr.appendChild(u)
-                            
-                            run.appendChild(rPr)
-                            t = dom.createElement('w:t')
-                            t.appendChild(dom.createTextNode(text))
-                            run.appendChild(t)
-                            
-                            hlink.appendChild(run)
-                            p.appendChild(hlink)
-                            
-                            # Save relationships immediately
-                            rel_mgr._save()
-                            continue
-                    
-                    # Case 2: Regular text (italic or plain)
-                    run = dom.createElement('w:r')
-                    rPr = dom.createElement('w:rPr')
-                    
-                    # Always use Times New Roman for consistency
-                    rFonts = dom.createElement('w:rFonts')
-                    rFonts.setAttribute('w:ascii', 'Times New Roman')
-                    rFonts.setAttribute('w:hAnsi', 'Times New Roman')
-                    rPr.appendChild(rFonts)
-                    
-                    run.appendChild(rPr)
-                    
-                    text_content = token
-                    if token.startswith('<em>'):
-                        # Extract italic text
-                        text_content = token[4:-5]
-                        # Add italic formatting
-                        i_elem = dom.createElement('w:i')
-                        run.getElementsByTagName('w:rPr')[0].appendChild(i_elem)
-                    
-                    t = dom.createElement('w:t')
-                    # Preserve spaces
-                    if text_content.startswith(' ') or text_content.endswith(' '):
-                        t.setAttribute('xml:space', 'preserve')
-                    t.appendChild(dom.createTextNode(text_content))
-                    run.appendChild(t)
-                    p.appendChild(run)
-            
-            # Ensure any additional empty paragraphs have EndnoteText style
-            for para_idx in range(1, len(paragraphs)):
-                para = paragraphs[para_idx]
-                # Check if paragraph has the style
+    # Get all paragraphs in this endnote
+    paragraphs = en.findall('.//w:p', NSMAP)
+    
+    # Work with the first paragraph (main content)
+    if paragraphs:
+        p = paragraphs[0]
+        
+        # Find and preserve the endnote reference run
+        ref_run = None
+        for run in p.iter(W + 'r'):
+            if run.find('.//w:endnoteRef', NSMAP) is not None:
+                ref_run = copy.deepcopy(run)  # Copy to preserve all properties
+                break
+        
+        # Clear the paragraph content but keep the paragraph element
+        del p[:]
+        
+        # Re-add paragraph properties with EndnoteText style
+        pPr = etree.SubElement(p, W + 'pPr')
+        etree.SubElement(pPr, W + 'pStyle', {W + 'val': 'EndnoteText'})
+        
+        # Re-add the endnote reference with proper style
+        if ref_run is not None:
+            # Ensure the reference has the proper style
+            rPr_elements = ref_run.findall('.//w:rPr', NSMAP)
+            if not rPr_elements:
+                rPr = etree.Element(W + 'rPr')
+                etree.SubElement(rPr, W + 'rStyle', {W + 'val': 'EndnoteReference'})
+                ref_run.insert(0, rPr)
+            else:
+                # Check if EndnoteReference style exists
                 has_style = False
-                for pPr in para.getElementsByTagName('w:pPr'):
-                    if pPr.getElementsByTagName('w:pStyle'):
+                for rPr in rPr_elements:
+                    if rPr.find('.//w:rStyle', NSMAP) is not None:
                         has_style = True
                         break
-                
                 if not has_style:
-                    # Add EndnoteText style
-                    pPr = dom.createElement('w:pPr')
-                    pStyle = dom.createElement('w:pStyle')
-                    pStyle.setAttribute('w:val', 'EndnoteText')
-                    pPr.appendChild(pStyle)
-                    # Insert at the beginning of the paragraph
-                    if para.firstChild:
-                        para.insertBefore(pPr, para.firstChild)
-                    else:
-                        para.appendChild(pPr)
-                
-    with open(path, 'w', encoding='utf-8') as f:
-        f.write(dom.toxml())
+                    etree.SubElement(rPr_elements[0], W + 'rStyle', {W + 'val': 'EndnoteReference'})
+            
+            p.append(ref_run)
+            
+            # Add space after endnote reference
+            r = etree.SubElement(p, W + 'r')
+            t = etree.SubElement(r, W + 't', {XML_SPACE: 'preserve'})
+            t.text = " "
+        
+        # Parse and add the HTML content, emitting runs as the parser reads it
+        parser = NoteHTMLParser(p, rel_mgr)
+        # Plain-text notes (no tags, no entities) skip the HTML parser entirely
+        if '<' not in html_content and '&' not in html_content:
+            if html_content: parser.add_text(html_content.replace('\xa0', ' '))
+        else:
+            parser.feed(html_content)
+            parser.close()
+    
+    # Ensure any additional empty paragraphs have EndnoteText style
+    for para in paragraphs[1:]:
+        # Check if paragraph has the style
+        has_style = False
+        for pPr in para.iter(W + 'pPr'):
+            if pPr.find('.//w:pStyle', NSMAP) is not None:
+                has_style = True
+                break
+        
+        if not has_style:
+            # Add EndnoteText style at the beginning of the paragraph
+            pPr = etree.Element(W + 'pPr')
+            etree.SubElement(pPr, W + 'pStyle', {W + 'val': 'EndnoteText'})
+            para.insert(0, pPr)
+
+    # Edits stay in memory; the part is serialized on download
+    user_data['dirty'] = True
+    user_data['version'] += 1
+
+def strip_zip64_extra(extra):
+    """Drops the Zip64 record from a ZipInfo.extra, keeping every other field; FileHeader() adds a fresh one if needed"""
+    kept = []
+    i = 0
+    while i + 4 <= len(extra):
+        tag, size = struct.unpack('<HH', extra[i:i + 4])
+        if tag != 1: kept.append(extra[i:i + 4 + size])
+        i += 4 + size
+    return b''.join(kept)
+
+def raw_copy_zip_member(src, dst, info):
+    """Copies a member's compressed bytes straight across, skipping the inflate/deflate round trip.
+    Relies on zipfile internals, so it is only used when RAW_ZIP_COPY confirmed they behave as expected."""
+    src.fp.seek(info.header_offset)
+    header = src.fp.read(zipfile.sizeFileHeader)
+    name_len, extra_len = struct.unpack('<HH', header[26:30])
+    src.fp.seek(info.header_offset + zipfile.sizeFileHeader + name_len + extra_len)
+    data = src.fp.read(info.compress_size)
+    zinfo = copy.copy(info)
+    zinfo.flag_bits &= ~0x08  # CRC and sizes are known, so they go in the local header
+    zinfo.extra = strip_zip64_extra(info.extra)
+    with dst._lock:
+        if dst._writing: raise ValueError("Can't copy a member while another is being written")
+        dst._writecheck(zinfo)
+        dst._didModify = True
+        zinfo.header_offset = dst.fp.tell()
+        dst.fp.write(zinfo.FileHeader())
+        dst.fp.write(data)
+        dst.filelist.append(zinfo)
+        dst.NameToInfo[zinfo.filename] = zinfo
+        dst.start_dir = dst.fp.tell()
+
+def stream_copy_zip_member(src, dst, info):
+    """Public-API fallback: inflates the member and re-deflates it with its original compression"""
+    zinfo = copy.copy(info)
+    with src.open(info) as fsrc, dst.open(zinfo, 'w') as fdst:
+        shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+
+def raw_zip_copy_supported():
+    """Round-trips a small archive through raw_copy_zip_member; False if this Python's zipfile internals have moved"""
+    payload = b'<w:t>raw copy check</w:t>' * 64
+    try:
+        packed, copied = io.BytesIO(), io.BytesIO()
+        with zipfile.ZipFile(packed, 'w', zipfile.ZIP_DEFLATED) as z: z.writestr('word/check.xml', payload)
+        with zipfile.ZipFile(packed) as src, zipfile.ZipFile(copied, 'w') as dst:
+            for info in src.infolist(): raw_copy_zip_member(src, dst, info)
+        with zipfile.ZipFile(copied) as z:
+            return z.testzip() is None and z.read('word/check.xml') == payload
+    except: return False
+
+# Checked once at import; a CPython whose zipfile internals changed falls back to the slower public API
+RAW_ZIP_COPY = raw_zip_copy_supported()
+
+def copy_zip_member(src, dst, info):
+    """Copies one member of `src` into `dst` unchanged"""
+    if RAW_ZIP_COPY: raw_copy_zip_member(src, dst, info)
+    else: stream_copy_zip_member(src, dst, info)
+
+def build_docx(user_data, output):
+    """Re-packs the uploaded .docx into `output`, swapping in the edited endnote parts"""
+    edited = {}
+    if user_data.get('dirty'):
+        edited[ENDNOTES_PART] = etree.tostring(user_data['endnotes_tree'], xml_declaration=True, encoding='UTF-8', standalone=True)
+    if user_data.get('rel_mgr') and user_data['rel_mgr'].dirty:
+        edited[ENDNOTES_RELS_PART] = user_data['rel_mgr'].to_xml()
+    with zipfile.ZipFile(user_data['source_file'], 'r') as src, zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED, compresslevel=EDITED_PART_COMPRESSLEVEL) as z:
+        for info in src.infolist():
+            if info.filename in edited: z.writestr(info.filename, edited.pop(info.filename))
+            else: copy_zip_member(src, z, info)
+        # Parts created during editing (e.g. a first endnotes.xml.rels)
+        for name, data in edited.items(): z.writestr(name, data)
 
 # ==================== ROUTES ====================
+@app.after_request
+def compress_response(response):
+    """Gzips text/JSON bodies for clients that accept it; note lists and the page shrink several-fold"""
+    if (response.status_code != 200 or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES or 'gzip' not in request.accept_encodings):
+        return response
+    is_static = request.endpoint == 'static'
+    if response.direct_passthrough:
+        # Static files come back as streamed file responses; read them in so they are compressed too
+        if not is_static: return response
+        response.direct_passthrough = False
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_SIZE: return response
+    etag, weak = response.get_etag()
+    compressed = STATIC_GZIP_CACHE.get(etag) if is_static and etag else None
+    if compressed is None:
+        compressed = gzip.compress(data, compresslevel=6)
+        if is_static and etag: STATIC_GZIP_CACHE.set(etag, compressed)
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    # The gzipped body is a different byte sequence, so any ETag only holds weakly
+    if etag and not weak: response.set_etag(etag, weak=True)
+    return response
+
 @app.route('/')
 def index():
     if 'user_id' not in session: session['user_id'] = str(uuid.uuid4())
     user_data = get_user_data()
     filename = user_data['original_filename'] if user_data else None
-    return render_template('index.html', filename=filename, publisher_map=PUBLISHER_PLACE_MAP)
+    return render_template('index.html', filename=filename, publisher_map_json=PUBLISHER_MAP_JSON)
 
 @app.route('/upload', methods=['POST'])
 def upload():
     file = request.files['file']
     if file:
-        if 'user_id' not in session: session['user_id'] = str(uuid.uuid4())
-        user_id = session['user_id']
-        if user_id in USER_DATA_STORE:
-            try: shutil.rmtree(USER_DATA_STORE[user_id]['temp_dir'])
-            except: pass
+        # Check the magic bytes first so bogus uploads cost neither a temp dir nor the current session
+        head = file.stream.read(len(ZIP_MAGIC))
+        file.stream.seek(0)
+        if head != ZIP_MAGIC: return "Not a .docx file", 400
         temp_dir = tempfile.mkdtemp()
-        original_filename = secure_filename(file.filename)
         input_path = os.path.join(temp_dir, 'source.docx')
         file.save(input_path)
-        extract_dir = os.path.join(temp_dir, 'extracted')
-        with zipfile.ZipFile(input_path, 'r') as z: z.extractall(extract_dir)
-        endnotes_file = os.path.join(extract_dir, 'word', 'endnotes.xml')
-        USER_DATA_STORE[user_id] = {
+        if not is_acceptable_docx(input_path):
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            return "Not a .docx file", 400
+        original_filename = secure_filename(file.filename)
+        if 'user_id' not in session: session['user_id'] = str(uuid.uuid4())
+        user_id = session['user_id']
+        with USER_DATA_LOCK: old_data = USER_DATA_STORE.pop(user_id, None)
+        if old_data: discard_user_data(old_data)
+        user_data = {
+            'lock': threading.Lock(),
             'temp_dir': temp_dir,
-            'extract_dir': extract_dir,
-            'endnotes_file': endnotes_file,
-            'original_filename': original_filename
+            'source_file': input_path,
+            'endnotes_tree': None,  # Parsed straight from source.docx on first use; nothing is extracted
+            'endnote_by_id': None,
+            'note_ids': None,
+            'note_html': {},  # note id -> converted note, dropped when that note is edited
+            'rel_mgr': None,
+            'dirty': False,
+            'doc_id': uuid.uuid4().hex,  # doc_id + version form the /get_notes ETag
+            'version': 0,
+            'original_filename': original_filename,
+            'last_used': time.monotonic()
         }
+        with USER_DATA_LOCK: USER_DATA_STORE[user_id] = user_data
+        evict_user_data()
     return index()
 
 @app.route('/reset')
 def reset():
     user_id = session.get('user_id')
-    if user_id and user_id in USER_DATA_STORE:
-        try: shutil.rmtree(USER_DATA_STORE[user_id]['temp_dir'])
-        except: pass
-        del USER_DATA_STORE[user_id]
+    with USER_DATA_LOCK: user_data = USER_DATA_STORE.pop(user_id, None) if user_id else None
+    if user_data: discard_user_data(user_data)
     return redirect(url_for('index'))
 
 @app.route('/get_notes')
 def get_notes(): 
+    """Returns notes in id order; ?offset=&limit= page through them so the editor can render as they arrive"""
     user_data = get_user_data()
-    if not user_data: return jsonify({'notes': []})
-    return jsonify({'notes': extract_endnotes_xml(user_data)})
+    if not user_data: return jsonify({'notes': [], 'total': 0})
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = request.args.get('limit', type=int)
+    if limit is not None: limit = max(limit, 0)
+    with user_data['lock']:
+        # Unchanged since the browser's copy: answer 304 without re-extracting anything
+        etag = f"{user_data['doc_id']}-{user_data['version']}"
+        if request.if_none_match.contains_weak(etag):
+            response = app.response_class(status=304)
+        else:
+            notes, total = extract_endnotes_xml(user_data, offset, limit)
+            response = jsonify({'notes': notes, 'total': total})
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
 
 @app.route('/search_book', methods=['POST'])
 def search_book(): return jsonify({'items': query_google_books(request.json['query'])})
 
+def map_lookups(fn, items):
+    """LOOKUP_POOL.map with at most MAX_LOOKUPS_PER_REQUEST of this call's tasks in the pool at a time"""
+    gate = threading.BoundedSemaphore(MAX_LOOKUPS_PER_REQUEST)
+    def run(item):
+        try: return fn(item)
+        finally: gate.release()
+    futures = []
+    for item in items:
+        gate.acquire()
+        futures.append(LOOKUP_POOL.submit(run, item))
+    return [future.result() for future in futures]
+
+@app.route('/search_batch', methods=['POST'])
+def search_batch():
+    """Resolves several queries at once; results come back in the order the queries were sent"""
+    queries = request.json['queries']
+    if len(queries) > MAX_BATCH_QUERIES:
+        return jsonify({'error': f'At most {MAX_BATCH_QUERIES} queries per batch'}), 400
+    # The same source is often cited in several notes; look each distinct query up only once
+    unique = list(dict.fromkeys(queries))
+    found = dict(zip(unique, map_lookups(query_google_books, unique)))
+    return jsonify({'results': [{'items': found[query]} for query in queries]})
+
 @app.route('/update_note', methods=['POST'])
 def update_note():
     user_data = get_user_data()
     if not user_data: return jsonify({'success': False, 'error': 'Session expired'})
     data = request.json
-    write_updated_note(user_data, data['id'], data['html'])
+    with user_data['lock']: write_updated_note(user_data, data['id'], data['html'])
+    return jsonify({'success': True})
+
+@app.route('/update_notes_batch', methods=['POST'])
+def update_notes_batch():
+    """Applies several queued editor saves under one lock acquisition: {'updates': [{'id', 'html'}, ...]}"""
+    user_data = get_user_data()
+    if not user_data: return jsonify({'success': False, 'error': 'Session expired'})
+    updates = request.get_json(force=True)['updates']
+    with user_data['lock']:
+        for update in updates: write_updated_note(user_data, update['id'], update['html'])
     return jsonify({'success': True})
 
 @app.route('/download')
@@ -585,11 +992,11 @@ def download():
     user_data = get_user_data()
     if not user_data: return "Session expired", 400
     output = os.path.join(user_data['temp_dir'], f"Resolved_{user_data['original_filename']}")
-    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as z:
-        for root, dirs, files in os.walk(user_data['extract_dir']):
-            for file in files:
-                p = os.path.join(root, file)
-                z.write(p, os.path.relpath(p, user_data['extract_dir']))
+    # Build beside the target and rename, so a concurrent download never streams a half-written file
+    tmp = output + '.tmp'
+    with user_data['lock']:
+        build_docx(user_data, tmp)
+        os.replace(tmp, output)
     return send_file(output, as_attachment=True)
 
 if __name__ == '__main__':
@@ -0,0 +1,330 @@
+// --- DATA LOADING & SETUP ---
+// Keys are lower-cased publisher names (the server sends the full map the same way)
+let PUBLISHER_MAP = {
+    'harvard university press': 'Cambridge, MA',
+    'mit press': 'Cambridge, MA',
+    'yale university press': 'New Haven',
+    'princeton university press': 'Princeton',
+    'university of california press': 'Berkeley',
+    'university of chicago press': 'Chicago',
+    'columbia university press': 'New York'
+};
+
+try {
+    const rawData = document.getElementById('publisher-data').textContent;
+    const tagCheck = '{' + '{ publisher_map';
+    if (rawData && !rawData.includes(tagCheck)) {
+        const parsed = JSON.parse(rawData);
+        if (parsed) PUBLISHER_MAP = parsed;
+    }
+} catch (e) {
+    console.log("Running in static mode.");
+}
+
+// Notes arrive a page at a time so the first rows are usable before the whole list is built
+const NOTES_PAGE_SIZE = 50;
+
+function loadNotes(offset) {
+    fetch(`/get_notes?offset=${offset}&limit=${NOTES_PAGE_SIZE}`).then(r => r.json()).then(data => {
+        const container = document.getElementById('notes-list');
+        if (offset === 0) container.innerHTML = ''; 
+
+        if (data.total === 0) {
+            container.innerHTML = '<div class="p-10 bg-white rounded-lg shadow text-center text-gray-600">No endnotes found in this document.</div>';
+            return;
+        }
+
+        data.notes.forEach(note => renderNote(container, note));
+        if (data.notes.length > 0 && offset + data.notes.length < data.total) loadNotes(offset + data.notes.length);
+    });
+}
+
+function renderNote(container, note) {
+    const div = document.createElement('div');
+    div.className = 'note-row bg-white p-6 rounded-xl shadow-md grid md:grid-cols-12 gap-6 items-start hover:shadow-lg transition duration-200';
+    div.innerHTML = `
+        <!-- Note ID Column -->
+        <div class="note-id col-span-1 flex justify-center pt-2">
+            <span class="text-2xl font-bold text-gray-400">${note.id}</span>
+        </div>
+
+        <!-- Editor and Search Results Column -->
+        <div class="col-span-12 md:col-span-8 space-y-4">
+            <!-- Rich Text Editor -->
+            <div class="editor-container relative">
+                <div class="rich-editor-pro" id="editor-${note.id}" contenteditable="true" 
+                     onblur="saveNote('${note.id}')">${note.html}</div>
+                <div class="save-status absolute bottom-0 right-0 mt-1 mr-2 text-xs font-medium text-green-600 transition duration-500 opacity-0" id="status-${note.id}">
+                    <i class="fas fa-check-circle mr-1"></i> Saved
+                </div>
+            </div>
+
+            <!-- Search Results Panel -->
+            <div class="results-panel border border-indigo-200 bg-indigo-50 p-3 rounded-lg max-h-72 overflow-y-auto" id="results-${note.id}">
+                <!-- Results populate here -->
+            </div>
+        </div>
+
+        <!-- Search Controls Column -->
+        <div class="actions col-span-12 md:col-span-3 space-y-3 pt-2">
+            <div class="search-wrapper flex space-x-2">
+                <input type="text" class="search-input w-full py-2 px-3 border border-gray-300 rounded-lg text-sm focus:ring-indigo-500 focus:border-indigo-500 shadow-sm" id="query-${note.id}" 
+                       value="${note.clean_term}" placeholder="Author/Title or URL..."
+                       onkeypress="if(event.key === 'Enter') searchCitation('${note.id}')">
+                <button class="btn bg-gray-200 hover:bg-gray-300 text-gray-700 py-2 px-3 rounded-lg shadow-sm" onclick="clearQuery('${note.id}')" title="Clear Search">
+                    <i class="fas fa-times"></i>
+                </button>
+            </div>
+            <button class="btn btn-primary w-full py-2.5 rounded-lg shadow-md" onclick="searchCitation('${note.id}')">
+                <i class="fas fa-search mr-2"></i> Find Source
+            </button>
+            <div class="loader text-center text-sm text-indigo-700 mt-2" id="loader-${note.id}">
+                <i class="fas fa-spinner fa-spin mr-2"></i> Searching...
+            </div>
+        </div>
+    `;
+    container.appendChild(div);
+}
+
+loadNotes(0);
+
+// --- FUNCTIONALITY (Logic remains the same as V19/V20) ---
+
+function clearQuery(id) {
+    const input = document.getElementById(`query-${id}`);
+    input.value = '';
+    input.focus();
+}
+
+// Searches fired within LOOKUP_BATCH_MS of each other go out as one /search_batch request,
+// which the server resolves concurrently; each caller gets its own {items} back
+const LOOKUP_BATCH_MS = 100;
+// Matches the server's MAX_BATCH_QUERIES; larger queues go out as several requests
+const LOOKUP_BATCH_MAX = 50;
+let lookupQueue = [];
+let lookupTimer = null;
+
+function lookupSource(query) {
+    return new Promise((resolve, reject) => {
+        lookupQueue.push({query, resolve, reject});
+        if (!lookupTimer) lookupTimer = setTimeout(flushLookups, LOOKUP_BATCH_MS);
+    });
+}
+
+function flushLookups() {
+    lookupTimer = null;
+    while (lookupQueue.length > LOOKUP_BATCH_MAX) sendLookups(lookupQueue.splice(0, LOOKUP_BATCH_MAX));
+    sendLookups(lookupQueue);
+    lookupQueue = [];
+}
+
+function sendLookups(batch) {
+    fetch('/search_batch', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({queries: batch.map(entry => entry.query)})
+    })
+    .then(r => r.json())
+    .then(data => batch.forEach((entry, i) => entry.resolve(data.results[i])))
+    .catch(err => batch.forEach(entry => entry.reject(err)));
+}
+
+function searchCitation(id) {
+    const query = document.getElementById(`query-${id}`).value;
+    if (!query.trim()) return;
+
+    const loader = document.getElementById(`loader-${id}`);
+    const panel = document.getElementById(`results-${id}`);
+
+    loader.style.display = 'block';
+    panel.style.display = 'none';
+    panel.innerHTML = '';
+
+    lookupSource(query)
+    .then(data => {
+        loader.style.display = 'none';
+        panel.style.display = 'block';
+
+        if (data.items.length === 0) {
+            panel.innerHTML = '<div class="p-3 text-center text-gray-500">No matching sources found.</div>';
+            return;
+        }
+
+        data.items.forEach(item => {
+            const place = item.publisher && PUBLISHER_MAP[item.publisher.trim().toLowerCase()];
+            if (!item.city && place) {
+                item.city = place;
+            }
+
+            const style = document.getElementById('style-selector').value;
+            const citationHTML = formatCitation(item, style);
+            const citationEncoded = encodeURIComponent(citationHTML);
+
+            let icon = '<i class="fas fa-book text-indigo-500"></i>';
+            if (item.type === 'gov') icon = '<i class="fas fa-landmark text-green-600"></i>';
+            else if (item.type === 'web') icon = '<i class="fas fa-globe text-blue-500"></i>';
+
+            let meta = item.authors.join(', ') + ' (' + item.year + ')';
+            if (item.type === 'web' || item.type === 'gov') {
+                meta = item.domain; // Use domain for meta preview
+            }
+
+            const card = document.createElement('div');
+            card.className = 'result-card bg-white p-3 border border-gray-200 rounded-lg mb-2 shadow-sm';
+            card.innerHTML = `
+                <div class="flex items-start justify-between">
+                    <span class="result-title text-sm font-semibold text-gray-800">${icon} ${item.title}</span>
+                    ${item.type === 'gov' ? '<span class="text-xs text-green-700 bg-green-100 px-2 py-0.5 rounded-full">Government</span>' : ''}
+                </div>
+                <div class="result-meta text-xs text-gray-500 mt-1">${meta}</div>
+                <div class="preview-badge text-xs bg-gray-50 p-2 rounded-md border border-gray-100 mt-2">${citationHTML}</div>
+                <div class="card-actions flex justify-end space-x-2 mt-3">
+                    <button class="btn-action btn-replace bg-red-500 hover:bg-red-600 text-white text-xs py-1.5 px-3 rounded-md" onclick="applyCitation('${id}', '${citationEncoded}', 'replace')">Replace</button>
+                    <button class="btn-action btn-append bg-green-500 hover:bg-green-600 text-white text-xs py-1.5 px-3 rounded-md" onclick="applyCitation('${id}', '${citationEncoded}', 'append')">+ Append</button>
+                </div>
+            `;
+            panel.appendChild(card);
+        });
+    });
+}
+
+function formatCitation(item, style) {
+    let citation = "";
+
+    if (item.type === 'web' || item.type === 'gov') {
+        // 1. Author (Agency Name)
+        let authorPrefix = "";
+        if (item.authors && item.authors.length > 0) {
+            authorPrefix = item.authors.join(', ') + ", ";
+        }
+
+        // 2. Date
+        let datePart = "";
+        if (item.last_updated) {
+             datePart += `last updated ${item.last_updated}, `;
+        }
+        datePart += `accessed ${item.access_date}`;
+
+        // 3. Link (CRITICAL: Link text and href MUST be identical for reliable Word conversion)
+        const link = `<a href="${item.url}">${item.url}</a>`;
+
+        if (style === 'chicago') {
+            citation = `${authorPrefix}“${item.title},” ${datePart}, ${link}.`;
+        } else if (style === 'mla') {
+            citation = `${authorPrefix}“${item.title}.” <em>Web</em>. ${datePart} &lt;${link}&gt;.`;
+        } else if (style === 'apa') {
+            citation = `${authorPrefix}${item.title}. Retrieved ${item.access_date}, from ${link}`;
+        }
+        return citation;
+    }
+
+    const authors = item.authors.join(', ');
+    if (style === 'chicago') {
+        citation = `${authors}, <em>${item.title}</em>`;
+        let pubParts = [];
+        if (item.city) pubParts.push(item.city);
+        if (item.publisher) pubParts.push(item.publisher);
+        if (item.year) pubParts.push(item.year);
+        if (pubParts.length > 0) citation += ` (${pubParts.join(': ')})`;
+        citation += ".";
+    } 
+    else if (style === 'mla') {
+        citation = `${authors}. <em>${item.title}</em>. ${item.publisher}, ${item.year}.`;
+    }
+    else if (style === 'apa') {
+        citation = `${authors} (${item.year}). <em>${item.title}</em>. ${item.publisher}.`;
+    }
+    return citation;
+}
+
+function applyCitation(id, encodedHtml, mode) {
+    const newHtml = decodeURIComponent(encodedHtml);
+    const editor = document.getElementById(`editor-${id}`);
+
+    if (mode === 'replace') {
+        editor.innerHTML = newHtml;
+    } else if (mode === 'append') {
+        let currentHtml = editor.innerHTML.trim();
+        const textContent = editor.innerText.trim();
+        let separator = "; ";
+        if (textContent.endsWith('.')) separator = " ";
+        else if (textContent.length === 0) separator = "";
+        editor.innerHTML = currentHtml + separator + newHtml;
+    }
+    document.getElementById(`results-${id}`).style.display = 'none';
+    saveNote(id);
+}
+
+// Saves are queued per note and sent together; the latest HTML for a note wins
+const SAVE_BATCH_MS = 500;
+let pendingUpdates = {};
+let saveTimer = null;
+
+function saveNote(id) {
+    const editor = document.getElementById(`editor-${id}`);
+    pendingUpdates[id] = editor.innerHTML;
+    if (!saveTimer) saveTimer = setTimeout(flushUpdates, SAVE_BATCH_MS);
+}
+
+function takePendingUpdates() {
+    const updates = Object.entries(pendingUpdates).map(([id, html]) => ({id, html}));
+    pendingUpdates = {};
+    clearTimeout(saveTimer);
+    saveTimer = null;
+    return updates;
+}
+
+function flushUpdates() {
+    const updates = takePendingUpdates();
+    if (updates.length === 0) return Promise.resolve();
+    return fetch('/update_notes_batch', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({updates})
+    }).then(response => {
+        if (!response.ok) throw new Error(`Save failed (HTTP ${response.status})`);
+        return response.json();
+    }).then(data => {
+        if (!data.success) throw new Error(data.error || 'Save failed');
+        updates.forEach(update => {
+            const status = document.getElementById(`status-${update.id}`);
+            status.style.opacity = '1';
+            setTimeout(() => status.style.opacity = '0', 2000);
+        });
+    }).catch(error => {
+        requeueUpdates(updates);
+        console.error(error);
+    });
+}
+
+// Put unsent edits back so the next save, download or page exit sends them again;
+// a note edited again in the meantime keeps its newer HTML
+function requeueUpdates(updates) {
+    updates.forEach(update => {
+        if (!(update.id in pendingUpdates)) pendingUpdates[update.id] = update.html;
+    });
+}
+
+// Leaving the page: hand whatever is still queued to the browser so it is delivered anyway.
+// text/plain keeps the beacon a CORS-safelisted request; the route parses it with get_json(force=True)
+function beaconUpdates() {
+    const updates = takePendingUpdates();
+    if (updates.length === 0) return;
+    let queued = false;
+    try {
+        queued = navigator.sendBeacon('/update_notes_batch', new Blob([JSON.stringify({updates})], {type: 'text/plain'}));
+    } catch (e) {
+        console.error(e);
+    }
+    // Refused (e.g. over the keepalive size quota): keep the edits for the next flush
+    if (!queued) requeueUpdates(updates);
+}
+document.addEventListener('visibilitychange', () => { if (document.visibilityState === 'hidden') beaconUpdates(); });
+window.addEventListener('pagehide', beaconUpdates);
+
+// The download must include edits still waiting in the queue
+document.querySelector('a[href="/download"]').addEventListener('click', event => {
+    if (Object.keys(pendingUpdates).length === 0) return;
+    event.preventDefault();
+    flushUpdates().finally(() => window.location.href = '/download');
+});
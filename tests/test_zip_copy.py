@@ -0,0 +1,72 @@
+import io
+import struct
+import unittest
+import zipfile
+
+import app
+
+# Extended-timestamp extra field (0x5455) that a copy must keep
+TIMESTAMP_EXTRA = struct.pack('<HHBI', 0x5455, 5, 1, 1700000000)
+
+
+class UnseekableWriter(io.BytesIO):
+    """Forces ZipFile to stream members with data descriptors (flag bit 3)"""
+    def seek(self, *args):
+        raise OSError('not seekable')
+
+
+def build_source(unseekable):
+    """Returns the bytes of an archive with deflated, stored and extra-field members"""
+    out = UnseekableWriter() if unseekable else io.BytesIO()
+    with zipfile.ZipFile(out, 'w') as z:
+        z.writestr('[Content_Types].xml', b'<Types/>' * 200, zipfile.ZIP_DEFLATED)
+        z.writestr('word/media/image1.png', bytes(range(256)) * 40, zipfile.ZIP_STORED)
+        info = zipfile.ZipInfo('word/document.xml', date_time=(2020, 1, 2, 3, 4, 6))
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.extra = TIMESTAMP_EXTRA
+        z.writestr(info, b'<w:document/>' * 500)
+    return out.getvalue()
+
+
+def round_trip(data, copy_member):
+    """Copies every member of `data` into a new archive with `copy_member`"""
+    out = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(data)) as src, zipfile.ZipFile(out, 'w') as dst:
+        for info in src.infolist(): copy_member(src, dst, info)
+    return out.getvalue()
+
+
+class CopyZipMemberTest(unittest.TestCase):
+
+    def check_copy(self, copy_member, unseekable):
+        data = build_source(unseekable)
+        copied = round_trip(data, copy_member)
+        with zipfile.ZipFile(io.BytesIO(data)) as src, zipfile.ZipFile(io.BytesIO(copied)) as dst:
+            self.assertIsNone(dst.testzip())
+            self.assertEqual(src.namelist(), dst.namelist())
+            for info in src.infolist():
+                out = dst.getinfo(info.filename)
+                self.assertEqual(src.read(info), dst.read(out))
+                self.assertEqual(info.compress_type, out.compress_type)
+                self.assertEqual(info.date_time, out.date_time)
+            self.assertIn(TIMESTAMP_EXTRA, dst.getinfo('word/document.xml').extra)
+
+    def test_raw_copy_supported(self):
+        # Fails loudly if a CPython upgrade moved the zipfile internals the raw copy relies on
+        self.assertTrue(app.RAW_ZIP_COPY)
+
+    def test_raw_copy(self):
+        self.check_copy(app.raw_copy_zip_member, unseekable=False)
+
+    def test_raw_copy_data_descriptors(self):
+        self.check_copy(app.raw_copy_zip_member, unseekable=True)
+
+    def test_stream_copy_fallback(self):
+        self.check_copy(app.stream_copy_zip_member, unseekable=False)
+
+    def test_stream_copy_fallback_data_descriptors(self):
+        self.check_copy(app.stream_copy_zip_member, unseekable=True)
+
+
+if __name__ == '__main__':
+    unittest.main()